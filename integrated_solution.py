@@ -3,10 +3,27 @@
 """
 
 from fastapi import FastAPI, UploadFile, File, Form, Query, HTTPException
-import requests
-from bs4 import BeautifulSoup
-import time
+from fastapi.concurrency import run_in_threadpool
+from fastapi.responses import ORJSONResponse, StreamingResponse
+import aiofiles
+import asyncio
+from asyncio_throttle import Throttler
+from cachetools import TTLCache
+import charset_normalizer
+import codecs
+from contextlib import asynccontextmanager
+import faiss
+import hashlib
+import httpx
+import mmap
+import numpy as np
+import orjson
 import os
+import re
+import tempfile
+import threading
+import time
+import zlib
 import logging
 from pydantic import BaseModel
 from typing import List, Optional
@@ -22,155 +39,371 @@ if not OPENAI_API_KEY:
 else:
     logger.info("已設置 OPENAI_API_KEY 環境變數")
 
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """應用生命週期：關閉時釋放共用的 HTTP 連線池"""
+    yield
+    if http_client is not None and not http_client.is_closed:
+        await http_client.aclose()
+
 app = FastAPI(
+    lifespan=lifespan,
     title="104 FastAPI 整合方案",
     description="搜索104工作、處理文檔和向量存儲查詢的集成API",
     version="1.0.0",
+    default_response_class=ORJSONResponse,
 )
 
 UPLOAD_FOLDER = "uploads"
+UPLOAD_CHUNK_SIZE = 1 << 20
+ENCODING_SAMPLE_SIZE = 1 << 20
+# 文件解碼時優先考慮的編碼：UTF-8、繁體中文（cp950/big5）、西歐（cp1252/latin-1）
+PREFERRED_ENCODINGS = ['utf_8', 'cp950', 'big5', 'cp1252', 'latin_1']
 os.makedirs(UPLOAD_FOLDER, exist_ok=True)
 
+SEARCH_104_URL = "https://www.104.com.tw/jobs/search/list"
+# 每個 worker 行程各自節流，以下上限皆為所有 worker 合計，再平均分給每個 worker
+WORKER_COUNT = max(1, int(os.getenv("WEB_CONCURRENCY", "1")))
+# 自適應並發控制：成功時逐步增加並發數，遇到 429/503 時減半
+MIN_CONCURRENCY = 2
+INITIAL_CONCURRENCY = max(MIN_CONCURRENCY, 10 // WORKER_COUNT)
+MAX_CONCURRENCY = max(MIN_CONCURRENCY, 32 // WORKER_COUNT)
+OVERLOAD_STATUS_CODES = {429, 503}
+# 每次請求結束後回報給並發限制器的結果
+OUTCOME_SUCCESS = "success"
+OUTCOME_OVERLOAD = "overload"
+OUTCOME_FAILURE = "failure"
+OVERLOAD_COOLDOWN = 1.0
+# 對104的請求速率上限（所有 worker 合計的每秒請求數），以非阻塞的方式節流；
+# 每個 worker 每 WORKER_COUNT / REQUESTS_PER_SECOND 秒發出一個請求，合計即為每秒 REQUESTS_PER_SECOND 個
+REQUESTS_PER_SECOND = int(os.getenv("API_104_REQUESTS_PER_SECOND", "5"))
+throttler = Throttler(rate_limit=1, period=WORKER_COUNT / REQUESTS_PER_SECOND)
+
+# 共用 HTTP 連線設定：保持連線並重用連線池，避免每次請求重新進行 TLS 握手
+DEFAULT_HEADERS = {
+    "User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36",
+    # 104 的 JSON 回應以文字為主，壓縮後傳輸量小很多；httpx 安裝 brotli 後會自動解壓
+    "Accept-Encoding": "br, gzip"
+}
+RETRY_STATUS_CODES = {429, 502, 503, 504}
+MAX_RETRIES = 5
+RETRY_BACKOFF_FACTOR = 0.3
+
+http_client: Optional[httpx.AsyncClient] = None
+
+# 職缺詳細信息快取，以 job_code 為鍵，一小時內重複查詢直接返回；只保存描述與條件，不保存完整 JSON
+job_details_cache = TTLCache(maxsize=4096, ttl=3600)
+job_details_cache_lock = threading.Lock()
+
+def get_http_client() -> httpx.AsyncClient:
+    """取得共用的 httpx client（HTTP/2 多工），第一次使用時才建立"""
+    global http_client
+    if http_client is None or http_client.is_closed:
+        http_client = httpx.AsyncClient(
+            http2=True,
+            limits=httpx.Limits(max_connections=50, max_keepalive_connections=20),
+            timeout=30,
+            headers=DEFAULT_HEADERS
+        )
+    return http_client
+
 # 定義 JobResult 類
 class JobResult:
+    # 使用 __slots__ 省去每個實例的 __dict__，減少記憶體並加快屬性存取
+    __slots__ = ("title", "company", "link", "description")
+
     def __init__(self, title, company, link):
         self.title = title
         self.company = company
         self.link = link
         self.description = ""
 
+    def to_dict(self):
+        return {
+            "title": self.title,
+            "company": self.company,
+            "link": self.link,
+            "description": self.description
+        }
+
     def __repr__(self):
         return f"JobResult(title={self.title}, company={self.company}, link={self.link}, description={self.description})"
 
-def get_job_details(job_url):
+# 定義自適應並發限制器（AIMD）
+class AdaptiveConcurrencyLimiter:
+    def __init__(self, initial, min_concurrency, max_concurrency, cooldown):
+        self.limit = initial
+        self.min_concurrency = min_concurrency
+        self.max_concurrency = max_concurrency
+        self.cooldown = cooldown
+        self._in_flight = 0
+        self._successes = 0
+        self._last_decrease = 0.0
+        # 延遲到事件循環中才建立，避免綁定到錯誤的事件循環
+        self._condition = None
+
+    def _get_condition(self):
+        if self._condition is None:
+            self._condition = asyncio.Condition()
+        return self._condition
+
+    async def acquire(self):
+        """等待直到進行中的請求數低於目前的並發上限"""
+        condition = self._get_condition()
+        async with condition:
+            await condition.wait_for(lambda: self._in_flight < self.limit)
+            self._in_flight += 1
+
+    async def release(self, outcome=OUTCOME_FAILURE):
+        """釋放名額並依結果調整並發上限：只有成功才增加，過載時減半，其他失敗不調整"""
+        condition = self._get_condition()
+        async with condition:
+            self._in_flight -= 1
+            now = time.monotonic()
+            if outcome == OUTCOME_OVERLOAD:
+                # 冷卻期內不重複減半，避免同一波 429 把並發數壓到最低
+                if now - self._last_decrease >= self.cooldown:
+                    self.limit = max(self.min_concurrency, self.limit // 2)
+                    self._last_decrease = now
+                    self._successes = 0
+                    logger.warning(f"104 回應過載，並發數降為 {self.limit}")
+            elif outcome == OUTCOME_SUCCESS:
+                # 每成功一整輪（limit 次）才加一，與 TCP 擁塞控制相同
+                self._successes += 1
+                if self._successes >= self.limit and self.limit < self.max_concurrency:
+                    self.limit += 1
+                    self._successes = 0
+            condition.notify_all()
+
+    def __repr__(self):
+        return f"AdaptiveConcurrencyLimiter(limit={self.limit}, in_flight={self._in_flight})"
+
+concurrency_limiter = AdaptiveConcurrencyLimiter(
+    INITIAL_CONCURRENCY, MIN_CONCURRENCY, MAX_CONCURRENCY, OVERLOAD_COOLDOWN
+)
+
+async def fetch_json(client, url, headers=None, params=None):
+    """發送 GET 請求並解析 JSON，遇到 429/502/503/504 或連線錯誤時以指數退避重試"""
+    for attempt in range(MAX_RETRIES + 1):
+        # 預設為失敗（含連線錯誤、非 2xx 回應與任務被取消），不會讓並發上限增加
+        outcome = OUTCOME_FAILURE
+        await concurrency_limiter.acquire()
+        try:
+            async with throttler:
+                response = await client.get(url, headers=headers, params=params)
+            if response.status_code in OVERLOAD_STATUS_CODES:
+                outcome = OUTCOME_OVERLOAD
+            if response.status_code not in RETRY_STATUS_CODES or attempt == MAX_RETRIES:
+                response.raise_for_status()
+                data = orjson.loads(response.content)
+                outcome = OUTCOME_SUCCESS
+                return data
+            logger.warning(f"請求 {url} 返回 {response.status_code}，準備重試")
+        except httpx.TransportError as e:
+            # 逾時代表對方處理不及，與 429/503 同樣視為過載
+            if isinstance(e, httpx.TimeoutException):
+                outcome = OUTCOME_OVERLOAD
+            if attempt == MAX_RETRIES:
+                raise
+            logger.warning(f"請求 {url} 連線失敗，準備重試")
+        finally:
+            await concurrency_limiter.release(outcome)
+        await asyncio.sleep(RETRY_BACKOFF_FACTOR * (2 ** attempt))
+
+async def get_job_details(client, job_url):
     """抓取工作詳細信息"""
     if job_url.startswith('//'):
         job_url = 'https:' + job_url
 
-    job_code = job_url.split('job/')[-1].split('?')[0]
+    _, _, tail = job_url.rpartition('job/')
+    job_code, _, _ = tail.partition('?')
     api_url = f'https://www.104.com.tw/job/ajax/content/{job_code}'
 
-    headers = {
-        "User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36",
-        "Referer": job_url
-    }
+    with job_details_cache_lock:
+        cached = job_details_cache.get(job_code)
+    if cached is not None:
+        return cached
+
+    headers = {"Referer": job_url}
 
     try:
-        response = requests.get(api_url, headers=headers)
-        response.raise_for_status()
-        job_data = response.json()
-        return {
+        job_data = await fetch_json(client, api_url, headers=headers)
+        details = {
             "description": job_data.get("data", {}).get("jobDetail", {}).get("jobDescription", ""),
             #"description": job_data['jobDetail']['jobDescription'],
-            "requirements": job_data.get("data", {}).get("condition", {}).get("acceptRole", {}).get("description", ""),
-            "raw_data": job_data
+            "requirements": job_data.get("data", {}).get("condition", {}).get("acceptRole", {}).get("description", "")
         }
     except Exception as e:
         return {"error": str(e)}
 
-def search_104_jobs_core(keyword: str, end_page: int):
-    """搜索104網站上的工作，實際的爬蟲邏輯"""
-    final_result = []
-    base_url = "https://www.104.com.tw/jobs/search/list"
+    with job_details_cache_lock:
+        job_details_cache[job_code] = details
+    return details
+
+async def fetch_page(client, keyword: str, current_page: int):
+    """抓取104搜索結果的單一頁面，返回該頁的職缺列表"""
+    logger.info(f"正在抓取第 {current_page} 頁")
 
-    params_template = {
+    params = {
         "ro": 0,
         "kwop": 7,
         "keyword": keyword,
         "order": 1,
-        "page": 1
+        "page": current_page
     }
 
-    headers = {
-        "User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36",
-        "Referer": "https://www.104.com.tw/"
-    }
+    headers = {"Referer": "https://www.104.com.tw/"}
+
+    data = await fetch_json(client, SEARCH_104_URL, headers=headers, params=params)
+
+    return data.get("data", {}).get("list", [])
+
+async def fetch_detail(client, job):
+    """將列表中的單一職缺轉為 JobResult 並補上詳細描述，返回 (JobResult, 錯誤訊息或 None)"""
+    job_name = job.get("jobName", "無標題")
+    company_name = job.get("custName", "未知公司")
+    #job_link = f"https://www.104.com.tw/job/{job.get('jobNo')}"
+    job_link = job.get("link", {}).get("job", "")
+    ##job_url = job['link']['job']
+    job_result = JobResult(
+        title=job_name,
+        company=company_name,
+        link=job_link
+    )
+
+    # 獲取詳細信息
+    details = await get_job_details(client, job_link)
+    if "error" in details:
+        return job_result, details["error"]
+    job_result.description = details.get("description", "")
+    return job_result, None
+
+async def fetch_job_list(client, keyword: str, end_page: int, errors: List[str]):
+    """並行抓取所有搜索頁面，返回合併後的職缺列表；失敗的頁面會被略過並記錄到 errors"""
+    pages = await asyncio.gather(
+        *[fetch_page(client, keyword, p) for p in range(1, end_page + 1)],
+        return_exceptions=True
+    )
+
+    jobs = []
+    for current_page, page in enumerate(pages, start=1):
+        if isinstance(page, Exception):
+            logger.error(f"抓取第 {current_page} 頁時出錯: {page}")
+            errors.append(f"第 {current_page} 頁: {page}")
+            continue
+        jobs.extend(page)
+    return jobs
+
+async def iter_104_jobs(keyword: str, end_page: int, errors: List[str]):
+    """搜索104網站上的工作，實際的爬蟲邏輯（所有頁面與詳細信息並行抓取）
+
+    每個職缺完成後立即產出（依完成順序）；抓取失敗的頁面與詳細信息會記錄到 errors
+    """
+    # 同時進行的請求數由 concurrency_limiter 控制，請求速率由 throttler 控制，取代原本逐頁 sleep 的節流方式
+    client = get_http_client()
+    jobs = await fetch_job_list(client, keyword, end_page, errors)
 
+    tasks = [asyncio.ensure_future(fetch_detail(client, job)) for job in jobs]
     try:
-        for current_page in range(1, end_page + 1):
-            logger.info(f"正在抓取第 {current_page} 頁")
-
-            params = params_template.copy()
-            params["page"] = current_page
-
-            response = requests.get(base_url, headers=headers, params=params)
-            response.raise_for_status()
-            data = response.json()
-
-            jobs_in_page = data.get("data", {}).get("list", [])
-            ####job_list = data.get("data", {}).get("list", [])
-            for job in jobs_in_page:
-                job_name = job.get("jobName", "無標題")
-                company_name = job.get("custName", "未知公司")
-                #job_link = f"https://www.104.com.tw/job/{job.get('jobNo')}"
-                job_link = job.get("link", {}).get("job", "")
-                ##job_url = job['link']['job']
-                job_result = JobResult(
-                    title=job_name,
-                    company=company_name,
-                    link=job_link
-                )
-
-                # 獲取詳細信息
-                details = get_job_details(job_link)
-                if details and "error" not in details:
-                    job_result.description = details.get("description", "")
-
-                final_result.append(job_result)
-
-            # 防止請求過於頻繁
-            if current_page < end_page:
-                time.sleep(1)
-
-    except Exception as e:
-        logger.error(f"搜索過程中出錯: {e}")
-
-    return final_result
+        for future in asyncio.as_completed(tasks):
+            job_result, error = await future
+            if error is not None:
+                logger.warning(f"抓取 {job_result.link} 詳細信息時出錯: {error}")
+                errors.append(f"{job_result.link}: {error}")
+            yield job_result
+    finally:
+        # 客戶端中途斷線時取消尚未完成的請求
+        for task in tasks:
+            task.cancel()
+
+def _plausible_encoding(raw, encoding: str) -> bool:
+    """排除偵測器對短文本常見的誤判：無 BOM 且不含 NUL 位元組的內容不會是 UTF-16/32"""
+    if encoding.startswith(("utf_16", "utf_32")):
+        has_bom = raw[:4].startswith((codecs.BOM_UTF16_LE, codecs.BOM_UTF16_BE))
+        return has_bom or b"\x00" in raw[:ENCODING_SAMPLE_SIZE]
+    return True
+
+def decode_document(raw):
+    """解碼文件內容，返回 (文字, 編碼)
+
+    先嚴格以 UTF-8 解碼；失敗時只在常用編碼（UTF-8、cp950、big5、cp1252、latin-1）之間
+    以 charset-normalizer 的混亂度評分挑選，這些編碼都不合適時才採用偵測器的其他結果
+    """
+    try:
+        return str(raw, 'utf-8'), 'utf-8'
+    except UnicodeDecodeError:
+        pass
+
+    # 偵測樣本截在最後一個換行處，避免切斷多位元組字元而誤判編碼
+    sample = raw[:ENCODING_SAMPLE_SIZE]
+    if len(raw) > ENCODING_SAMPLE_SIZE:
+        cut = sample.rfind(b"\n")
+        if cut > 0:
+            sample = sample[:cut + 1]
+
+    # 大多數 8 位元編碼都能「成功」解碼任意位元組，偵測器的首選不可直接信任
+    candidates = [
+        match.encoding for match in charset_normalizer.from_bytes(sample, cp_isolation=PREFERRED_ENCODINGS)
+    ]
+    if not candidates:
+        candidates = [
+            match.encoding for match in charset_normalizer.from_bytes(sample)
+            if _plausible_encoding(raw, match.encoding)
+        ]
+
+    for encoding in candidates + ['cp950', 'big5']:
+        if encoding == 'utf_8':
+            # 樣本是有效的 UTF-8（整份嚴格解碼已失敗），只有少量無效位元組，替換即可
+            return str(raw, 'utf-8', errors='replace'), encoding
+        try:
+            return str(raw, encoding), encoding
+        except (UnicodeDecodeError, LookupError):
+            logger.warning(f"無法以 {encoding} 編碼讀取文件，嘗試下一個編碼")
+
+    if candidates:
+        # 樣本判斷可信但文件中有少量無效位元組，替換無效字符
+        return str(raw, candidates[0], errors='replace'), candidates[0]
+    # latin-1 可解碼任何位元組，至少保留 ASCII 內容可供搜尋
+    return str(raw, 'latin-1'), 'latin-1'
 
 def simple_document_search(query: str, file_path: str):
     """簡化版的文檔查詢實現，不使用 LangChain"""
     try:
-        # 嘗試使用不同的編碼來讀取文件
-        encodings = ['utf-8', 'latin-1', 'cp950', 'big5']
-        content = None
-        
-        for encoding in encodings:
-            try:
-                with open(file_path, 'r', encoding=encoding) as f:
-                    content = f.read()
-                logger.info(f"成功以 {encoding} 編碼讀取文件")
-                break
-            except UnicodeDecodeError:
-                logger.warning(f"無法以 {encoding} 編碼讀取文件，嘗試下一個編碼")
-        
-        if content is None:
-            # 如果所有編碼都失敗，嘗試二進制讀取
-            with open(file_path, 'rb') as f:
-                content = f.read().decode('utf-8', errors='replace')
-            logger.info("使用二進制讀取並轉換為 UTF-8（替換無效字符）")
+        # 以 mmap 映射文件，只讀一次磁碟，由系統頁面快取支撐後續解碼
+        with open(file_path, 'rb') as f:
+            if os.fstat(f.fileno()).st_size == 0:
+                raw = b""
+            else:
+                raw = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+        try:
+            content, encoding = decode_document(raw)
+            logger.info(f"以 {encoding} 編碼讀取文件")
+        finally:
+            if isinstance(raw, mmap.mmap):
+                raw.close()
         
-        # 簡單的關鍵字匹配
-        found = query.lower() in content.lower()
+        # 不分大小寫的關鍵字匹配，直接在原文上掃描，不另外建立小寫副本
+        match = re.compile(re.escape(query), re.IGNORECASE).search(content)
+        found = match is not None
         
         # 獲取相關上下文
+        content_len = len(content)
         if found:
-            # 嘗試找到查詢詞在內容中的位置
-            query_pos = content.lower().find(query.lower())
+            # 直接使用匹配的起訖位置，不再對 query 或 content 呼叫 lower()
+            start_pos = max(0, match.start() - 150)
+            end_pos = min(content_len, match.end() + 150)
             
-            # 獲取查詢詞前後的上下文
-            start_pos = max(0, query_pos - 150)
-            end_pos = min(len(content), query_pos + len(query) + 150)
-            
-            # 提取上下文
+            # 提取上下文（保留原文大小寫）
             context = content[start_pos:end_pos]
             
             if start_pos > 0:
                 context = "..." + context
-            if end_pos < len(content):
+            if end_pos < content_len:
                 context = context + "..."
         else:
             # 如果沒找到，只顯示前300個字符
-            context = content[:300] + "..." if len(content) > 300 else content
+            context = content[:300] + "..." if content_len > 300 else content
         
         return {
             "query": query,
@@ -182,40 +415,188 @@ def simple_document_search(query: str, file_path: str):
         logger.error(f"處理文檔時出錯: {e}")
         return {"error": str(e), "message": "處理文檔時發生錯誤"}
 
+# 向量搜尋的示例語料，在載入時建立索引
+sample_texts = [
+    "LangChain 是一個用於開發由語言模型驅動的應用程序的框架。",
+    "它能讓你建立起語言模型與其他資料來源的連結。"
+]
+
+EMBEDDING_DIM = 256
+VECTOR_SEARCH_TOP_K = 5
+VECTOR_MIN_SIMILARITY = 0.2
+# IVFPQ 參數；FAISS 每個聚類中心至少需要約 39 筆訓練資料，語料不足時改用精確的 Flat 索引
+IVF_NLIST = 100
+PQ_M = 16
+PQ_NBITS = 8
+VECTOR_INDEX_PATH = os.getenv("VECTOR_INDEX_PATH")
+
+def embed_text(text: str):
+    """將文字轉為向量（字元 unigram/bigram 雜湊後正規化），不依賴 OpenAI"""
+    vector = np.zeros(EMBEDDING_DIM, dtype="float32")
+    lowered = text.lower()
+    grams = list(lowered) + [lowered[i:i + 2] for i in range(len(lowered) - 1)]
+    for gram in grams:
+        if not gram.isspace():
+            vector[zlib.crc32(gram.encode("utf-8")) % EMBEDDING_DIM] += 1.0
+    norm = np.linalg.norm(vector)
+    return vector / norm if norm > 0 else vector
+
+def corpus_fingerprint(texts: List[str]) -> str:
+    """語料與向量維度的雜湊，用來確認磁碟上的索引與目前語料一致"""
+    digest = hashlib.sha256(str(EMBEDDING_DIM).encode("utf-8"))
+    for text in texts:
+        digest.update(b"\0" + text.encode("utf-8"))
+    return digest.hexdigest()
+
+def _atomic_write(path: str, write):
+    """先寫入同目錄的臨時文件再改名，多個 worker 同時寫入也不會讀到半份文件"""
+    fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(os.path.abspath(path)))
+    os.close(fd)
+    try:
+        write(tmp_path)
+        os.replace(tmp_path, path)
+    except Exception:
+        os.remove(tmp_path)
+        raise
+
+def load_vector_index(texts: List[str]):
+    """載入 VECTOR_INDEX_PATH 的索引；不存在或與目前語料不符時返回 None"""
+    meta_path = VECTOR_INDEX_PATH + ".meta.json"
+    if not (os.path.exists(VECTOR_INDEX_PATH) and os.path.exists(meta_path)):
+        return None
+    try:
+        with open(meta_path, "rb") as f:
+            meta = orjson.loads(f.read())
+        if meta.get("fingerprint") != corpus_fingerprint(texts):
+            logger.warning(f"{VECTOR_INDEX_PATH} 與目前語料不符，重新建立向量索引")
+            return None
+        index = faiss.read_index(VECTOR_INDEX_PATH)
+    except Exception as e:
+        logger.warning(f"載入向量索引失敗，重新建立: {e}")
+        return None
+    if index.ntotal != len(texts):
+        logger.warning(f"{VECTOR_INDEX_PATH} 筆數與目前語料不符，重新建立向量索引")
+        return None
+    logger.info(f"從 {VECTOR_INDEX_PATH} 載入向量索引")
+    return index
+
+def build_vector_index(texts: List[str]):
+    """建立（或從磁碟載入）示例語料的 FAISS 索引"""
+    if VECTOR_INDEX_PATH:
+        index = load_vector_index(texts)
+        if index is not None:
+            return index
+
+    embeddings = np.stack([embed_text(text) for text in texts])
+    if len(texts) >= IVF_NLIST * 39:
+        quantizer = faiss.IndexFlatL2(EMBEDDING_DIM)
+        index = faiss.IndexIVFPQ(quantizer, EMBEDDING_DIM, IVF_NLIST, PQ_M, PQ_NBITS)
+        index.train(embeddings)
+        index.nprobe = 10
+    else:
+        index = faiss.IndexFlatL2(EMBEDDING_DIM)
+    index.add(embeddings)
+
+    if VECTOR_INDEX_PATH:
+        meta = orjson.dumps({"fingerprint": corpus_fingerprint(texts), "count": len(texts)})
+
+        def write_meta(path):
+            with open(path, "wb") as f:
+                f.write(meta)
+
+        _atomic_write(VECTOR_INDEX_PATH, lambda path: faiss.write_index(index, path))
+        _atomic_write(VECTOR_INDEX_PATH + ".meta.json", write_meta)
+    return index
+
+vector_index = build_vector_index(sample_texts)
+logger.info(f"已建立向量索引，共 {vector_index.ntotal} 筆資料")
+
 def simple_vectorstore_search(query: str):
     """簡化版的向量搜尋實現，不使用 LangChain"""
-    # 這裡只是一個占位實現，沒有 OpenAI 依賴
-    sample_texts = [
-        "LangChain 是一個用於開發由語言模型驅動的應用程序的框架。",
-        "它能讓你建立起語言模型與其他資料來源的連結。"
+    # 向量皆為單位長度，L2 距離平方 d 對應餘弦相似度 1 - d / 2
+    k = min(VECTOR_SEARCH_TOP_K, vector_index.ntotal)
+    distances, ids = vector_index.search(embed_text(query).reshape(1, -1), k)
+    matched_texts = [
+        sample_texts[i] for dist, i in zip(distances[0], ids[0])
+        if i != -1 and 1 - dist / 2 >= VECTOR_MIN_SIMILARITY
     ]
     
-    # 簡單的關鍵字匹配
-    matched_texts = [text for text in sample_texts if query.lower() in text.lower()]
-    
     return {
         "query": query,
         "answer": f"找到 {len(matched_texts)} 個相關結果",
         "matched_sources": matched_texts
     }
 
+# 端點層級的回應快取，相同參數在 5 分鐘內直接返回先前結果
+RESPONSE_CACHE_MAXSIZE = 512
+RESPONSE_CACHE_TTL = 300
+document_result_cache = TTLCache(maxsize=RESPONSE_CACHE_MAXSIZE, ttl=RESPONSE_CACHE_TTL)
+
+vectorstore_result_cache = TTLCache(maxsize=RESPONSE_CACHE_MAXSIZE, ttl=RESPONSE_CACHE_TTL)
+search_result_cache = TTLCache(maxsize=RESPONSE_CACHE_MAXSIZE, ttl=RESPONSE_CACHE_TTL)
+
+async def stream_jobs(keyword: str, end_page: int):
+    """以 NDJSON 逐行輸出104搜索結果，並以 (關鍵詞, 頁數) 為鍵快取完整結果"""
+    cache_key = (keyword, end_page)
+    cached = search_result_cache.get(cache_key)
+    if cached is not None:
+        for job_result in cached:
+            yield orjson.dumps(job_result.to_dict()) + b"\n"
+        return
+
+    results = []
+    errors = []
+    try:
+        async for job_result in iter_104_jobs(keyword, end_page, errors):
+            results.append(job_result)
+            yield orjson.dumps(job_result.to_dict()) + b"\n"
+    except Exception as e:
+        logger.error(f"處理104搜索請求時發生錯誤: {str(e)}")
+        yield orjson.dumps({"error": "搜索請求處理失敗", "detail": str(e)}) + b"\n"
+        return
+
+    logger.info(f"成功獲取搜索結果，共 {len(results)} 個職位，{len(errors)} 個抓取錯誤")
+    if errors:
+        # 以最後一行回報抓取失敗的頁面與職缺，讓客戶端分辨「沒有結果」與「抓取失敗」
+        yield orjson.dumps({
+            "error": "部分抓取失敗" if results else "搜索請求處理失敗",
+            "errors": errors
+        }) + b"\n"
+        return
+
+    # 空結果可能來自暫時性錯誤，不保留在快取中
+    if results:
+        search_result_cache[cache_key] = results
+
 @app.post("/document")
 async def process_document_query(query: str = Form(...), file: UploadFile = File(...)):
     """文件查詢API"""
     logger.info(f"處理文件查詢 - 查詢: {query}")
     try:
-        # 將上傳的文件保存
-        file_path = os.path.join(UPLOAD_FOLDER, file.filename)
-        with open(file_path, "wb") as buffer:
-            buffer.write(await file.read())
-        
-        # 處理查詢
-        result = simple_document_search(query, file_path)
-        
-        # 清理臨時文件
-        if os.path.exists(file_path):
-            os.remove(file_path)
+        # 將上傳的文件分塊寫入臨時文件，避免整個文件讀進記憶體；
+        # 不使用客戶端提供的文件名。先關閉 mkstemp 的檔案描述符再以路徑重新開啟，
+        # 避免 Windows 上同一文件被開啟兩次而出現 PermissionError
+        fd, tmp_path = tempfile.mkstemp(dir=UPLOAD_FOLDER)
+        os.close(fd)
+        try:
+            file_hash = hashlib.sha256()
+            async with aiofiles.open(tmp_path, "wb") as buffer:
+                while chunk := await file.read(UPLOAD_CHUNK_SIZE):
+                    file_hash.update(chunk)
+                    await buffer.write(chunk)
             
+            # 相同內容與查詢詞的文件直接返回快取結果
+            cache_key = (file_hash.hexdigest(), query)
+            result = document_result_cache.get(cache_key)
+            if result is None:
+                # 處理查詢（在執行緒池中進行，不阻塞事件循環）
+                result = await run_in_threadpool(simple_document_search, query, tmp_path)
+                if "error" not in result:
+                    document_result_cache[cache_key] = result
+        finally:
+            # 清理臨時文件
+            os.remove(tmp_path)
+        
         return result
     except Exception as e:
         logger.error(f"處理文件查詢時發生錯誤: {str(e)}")
@@ -226,7 +607,12 @@ async def process_vectorstore_query(query: str):
     """向量存儲查詢API"""
     logger.info(f"處理向量存儲查詢 - 查詢: {query}")
     try:
-        result = simple_vectorstore_search(query)
+        # 相同查詢詞直接返回快取結果
+        cache_key = query.strip()
+        result = vectorstore_result_cache.get(cache_key)
+        if result is None:
+            result = simple_vectorstore_search(cache_key)
+            vectorstore_result_cache[cache_key] = result
         return result
     except Exception as e:
         logger.error(f"處理向量存儲查詢時發生錯誤: {str(e)}")
@@ -242,19 +628,18 @@ async def process_search_104_query(
     
     - **keyword**: 搜索關鍵字 (例如: Python, 數據分析)
     - **end_page**: 搜索的結束頁數 (默認: 1)
+    
+    回應格式為 NDJSON（application/x-ndjson），每行一個職缺；
+    有頁面或職缺抓取失敗時，最後一行為 {"error": ..., "errors": [...]}
     """
     logger.info(f"處理104搜索請求 - 關鍵詞: {keyword}, 頁數: {end_page}")
     
-    try:
-        results = search_104_jobs_core(keyword, end_page)
-        logger.info(f"成功獲取搜索結果，共 {len(results)} 個職位")
-        return {"results": results}
-    except Exception as e:
-        logger.error(f"處理104搜索請求時發生錯誤: {str(e)}")
-        return {
-            "error": "搜索請求處理失敗",
-            "detail": str(e)
-        }
+    # 每完成一個職缺就輸出一行 JSON，客戶端不必等待全部結果；
+    # 抓取錯誤在串流開始後才會發生，由 stream_jobs 在最後以 {"error", "errors"} 行回報
+    return StreamingResponse(
+        stream_jobs(keyword.strip(), end_page),
+        media_type="application/x-ndjson"
+    )
 
 @app.get("/")
 async def root():
@@ -290,7 +675,3 @@ async def langserve_search_104_query(
 ):
     """LangServe 兼容的104搜索端點"""
     return await process_search_104_query(keyword, end_page)
-
-if __name__ == "__main__":
-    import uvicorn
-    uvicorn.run(app, host="0.0.0.0", port=int(os.getenv("PORT", "8000")))
\ No newline at end of file
@@ -6,14 +6,27 @@
 import uvicorn
 import os
 import logging
-from integrated_solution import app
+from integrated_solution import app  # 供 `uvicorn main:app` 使用
 
-# 設置日誌
-logging.basicConfig(level=logging.INFO)
+# 日誌設定已在 integrated_solution 中完成
 logger = logging.getLogger(__name__)
 
 if __name__ == "__main__":
     # 使用主要的PORT環境變數，這是Railway會設置的
     port = int(os.getenv('PORT', 8080))
-    logger.info(f"啟動FastAPI應用於端口: {port}")
-    uvicorn.run(app, host="0.0.0.0", port=port)
+    # 多個 worker 行程並使用 httptools；有安裝 uvloop 時（非 Windows）自動採用
+    # 每個 worker 各自擁有連線池、快取與向量索引，對104的速率與並發上限會依 worker 數平分，
+    # 因此預設只開 2 個 worker，需要時以 WEB_CONCURRENCY 調整
+    workers = int(os.getenv('WEB_CONCURRENCY', 2))
+    # worker 行程依此環境變數計算各自的節流額度
+    os.environ['WEB_CONCURRENCY'] = str(workers)
+    logger.info(f"啟動FastAPI應用於端口: {port}，worker 數: {workers}")
+    uvicorn.run(
+        "integrated_solution:app",
+        host="0.0.0.0",
+        port=port,
+        workers=workers,
+        loop="auto",
+        http="httptools",
+        log_level="info",
+    )
@@ -0,0 +1,163 @@
+"""
+integrated_solution 的文件解碼、並發控制與104搜索串流測試
+"""
+
+import asyncio
+import json
+import os
+
+import httpx
+import pytest
+from asyncio_throttle import Throttler
+from fastapi.testclient import TestClient
+
+import integrated_solution
+from integrated_solution import ENCODING_SAMPLE_SIZE, AdaptiveConcurrencyLimiter, app, decode_document
+
+LINE = "本公司專注於雲端服務與人工智慧應用開發，徵求資料工程師。\n"
+
+
+@pytest.mark.parametrize("text, encoding", [
+    # 短的 cp950 文本曾被誤判為 utf_16_be
+    ("職缺說明：熟悉 Python 與資料分析", "cp950"),
+    (LINE * 200, "cp950"),
+    # 8 位元西歐文本曾被誤判為 cp1006/cp1257/gb18030/big5
+    ("Le café est très bon.", "latin-1"),
+    ("Déjà vu, Müller Straße, niño façade.", "latin-1"),
+    ("Bonjour à tous, ceci est un déjà-vu très agréable. " * 20, "latin-1"),
+    ("“Smart quotes” – café … €5", "cp1252"),
+    ("hello python", "utf-16"),
+])
+def test_decode_document_round_trips(text, encoding):
+    content, _ = decode_document(text.encode(encoding))
+    assert content == text
+
+
+def test_decode_document_large_utf8_not_split_at_sample_boundary():
+    # 前置 2 個位元組讓樣本邊界落在多位元組字元中間
+    text = "xx" + LINE * (ENCODING_SAMPLE_SIZE // len(LINE.encode("utf-8")) + 100) + "目標字串\n"
+    content, encoding = decode_document(text.encode("utf-8"))
+    assert encoding == "utf-8"
+    assert content == text
+
+
+def test_decode_document_utf8_with_invalid_byte():
+    text = "xx" + LINE * 20000 + "目標字串\n"
+    content, _ = decode_document(text.encode("utf-8") + b"\xff")
+    assert content.startswith(text)
+
+
+def test_document_endpoint_finds_latin1_query():
+    with TestClient(app) as client:
+        response = client.post(
+            "/document",
+            data={"query": "café"},
+            files={"file": ("latin1.txt", "Le café est très bon.".encode("latin-1"))},
+        )
+    assert response.json()["found"] is True
+
+
+def test_document_endpoint_removes_temp_file():
+    before = set(os.listdir(integrated_solution.UPLOAD_FOLDER))
+    with TestClient(app) as client:
+        response = client.post(
+            "/document",
+            data={"query": "python"},
+            files={"file": ("../../evil.txt", b"learn python here")},
+        )
+    assert response.json()["found"] is True
+    assert set(os.listdir(integrated_solution.UPLOAD_FOLDER)) == before
+
+
+@pytest.fixture
+def limiter(monkeypatch):
+    """換上全新的並發限制器，並關閉節流與重試等待"""
+    fresh = AdaptiveConcurrencyLimiter(2, 2, 32, cooldown=0.0)
+    monkeypatch.setattr(integrated_solution, "concurrency_limiter", fresh)
+    monkeypatch.setattr(integrated_solution, "throttler", Throttler(rate_limit=1000, period=1.0))
+    monkeypatch.setattr(integrated_solution, "RETRY_BACKOFF_FACTOR", 0)
+    return fresh
+
+
+def _fetch_many(handler, count):
+    async def run():
+        async with httpx.AsyncClient(transport=httpx.MockTransport(handler)) as client:
+            return await asyncio.gather(
+                *[integrated_solution.fetch_json(client, "https://example.test/") for _ in range(count)],
+                return_exceptions=True
+            )
+    return asyncio.run(run())
+
+
+def test_limiter_grows_on_success(limiter):
+    _fetch_many(lambda request: httpx.Response(200, json={}), 10)
+    assert limiter.limit > 2
+
+
+@pytest.mark.parametrize("handler", [
+    lambda request: (_ for _ in ()).throw(httpx.ConnectError("unreachable")),
+    lambda request: httpx.Response(502),
+    lambda request: httpx.Response(404),
+])
+def test_limiter_does_not_grow_on_failure(limiter, handler):
+    _fetch_many(handler, 10)
+    assert limiter.limit == 2
+
+
+@pytest.mark.parametrize("handler", [
+    lambda request: httpx.Response(429),
+    lambda request: (_ for _ in ()).throw(httpx.ReadTimeout("slow")),
+])
+def test_limiter_backs_off_on_overload(limiter, handler):
+    limiter.limit = 16
+    _fetch_many(handler, 1)
+    assert limiter.limit < 16
+
+
+@pytest.fixture
+def mock_104(limiter, monkeypatch):
+    """以 MockTransport 取代共用的 httpx client，並清空搜索快取"""
+    def install(handler):
+        monkeypatch.setattr(integrated_solution, "MAX_RETRIES", 0)
+        monkeypatch.setattr(
+            integrated_solution, "http_client",
+            httpx.AsyncClient(transport=httpx.MockTransport(handler))
+        )
+    integrated_solution.search_result_cache.clear()
+    integrated_solution.job_details_cache.clear()
+    yield install
+    integrated_solution.search_result_cache.clear()
+    integrated_solution.job_details_cache.clear()
+
+
+def _search_lines(keyword):
+    with TestClient(app) as client:
+        response = client.get("/search_104", params={"keyword": keyword})
+    return [json.loads(line) for line in response.text.splitlines()]
+
+
+def test_search_104_reports_errors_when_104_is_down(mock_104):
+    def handler(request):
+        raise httpx.ConnectError("unreachable")
+    mock_104(handler)
+
+    lines = _search_lines("python")
+    assert len(lines) == 1
+    assert lines[0]["errors"]
+    assert not integrated_solution.search_result_cache
+
+
+def test_search_104_reports_partial_failures_and_skips_cache(mock_104):
+    def handler(request):
+        if "search" in request.url.path:
+            jobs = [{"jobName": f"J{i}", "custName": "C", "link": {"job": f"//www.104.com.tw/job/a{i}"}} for i in range(3)]
+            return httpx.Response(200, json={"data": {"list": jobs}})
+        if request.url.path.endswith("a1"):
+            return httpx.Response(500)
+        return httpx.Response(200, json={"data": {"jobDetail": {"jobDescription": "desc"}}})
+    mock_104(handler)
+
+    lines = _search_lines("python")
+    assert len([line for line in lines if "title" in line]) == 3
+    assert len(lines[-1]["errors"]) == 1
+    assert not integrated_solution.search_result_cache